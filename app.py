@@ -1,6 +1,14 @@
+# gevent 的猴子补丁必须在导入 serial/threading/flask 之前执行，
+# 这样控制器的监听线程和串口读写才会与 WebSocket 事件循环协作，而不是阻塞它
+from gevent import monkey
+monkey.patch_all()
+
 import time
 import atexit
-from flask import Flask, jsonify, request, render_template
+from gevent.pool import Pool
+from gevent.pywsgi import WSGIServer
+from geventwebsocket.handler import WebSocketHandler
+from flask import Flask, Response, jsonify, request, render_template
 from flask_socketio import SocketIO, emit
 from flask_cors import CORS
 
@@ -11,6 +19,8 @@ SERIAL_PORT = "COM2"
 DEVICE_ADDRESS = 1
 FLASK_HOST = '0.0.0.0' 
 FLASK_PORT = 5000
+WSGI_POOL_SIZE = 1000  # gevent服务器可同时处理的最大连接数 (HTTP + WebSocket)
+BROADCAST_INTERVAL = 0.1  # WebSocket状态广播的最短间隔 (秒)
 
 # --- 应用初始化 ---
 app = Flask(__name__)
@@ -27,16 +37,23 @@ CORS(app, resources={r"/api/*": {"origins": "*"}})
 #    同样，在生产环境中应指定具体来源。
 socketio = SocketIO(app, async_mode='gevent', cors_allowed_origins="*")
 
-# --- 回调函数定义 ---
-def broadcast_status_update(state_data):
+# --- 后台广播任务 ---
+def broadcast_status_updates():
     """
-    这个函数会被LockerController调用。
-    它的作用是通过WebSocket向所有连接的客户端广播最新的状态。
+    后台任务：通过WebSocket向所有连接的客户端广播最新的状态。
+    监听线程只负责标记状态已更新，这里阻塞等待该标记，没有新状态时不会被定时唤醒；
+    每次广播后至少间隔 BROADCAST_INTERVAL，因此无论状态帧来得多快，每个间隔最多只广播一次。
     """
-    print(f"通过WebSocket广播状态: {state_data}")
-    # 'update_status' 是自定义的事件名
-    # namespace='/' 表示广播给默认命名空间下的所有客户端
-    socketio.emit('update_status', state_data, namespace='/')
+    while True:
+        controller.consume_update(timeout=None)
+        state_data = controller.get_current_state()
+        # 状态字典作为参数传入，只有开启DEBUG级别时才会被格式化
+        app.logger.debug("通过WebSocket广播状态: %s", state_data)
+        # 'update_status' 是自定义的事件名
+        # namespace='/' 表示广播给默认命名空间下的所有客户端
+        socketio.emit('update_status', state_data, namespace='/')
+        # 间隔内到达的多次更新合并到下一次广播
+        socketio.sleep(BROADCAST_INTERVAL)
 
 # --- 创建并启动控制器 (关键步骤) ---
 # 创建一个全局的、唯一的控制器实例
@@ -44,8 +61,7 @@ def broadcast_status_update(state_data):
 print("正在初始化快递柜控制器...")
 controller = LockerController(
         port=SERIAL_PORT, 
-        device_address=DEVICE_ADDRESS,
-        on_update_callback=broadcast_status_update
+        device_address=DEVICE_ADDRESS
 )
 
 # 注册一个程序退出时执行的函数，用于安全地断开串口连接
@@ -62,6 +78,8 @@ if not controller.connect():
 else:
     print("控制器连接成功，Flask应用准备就绪。")
 
+socketio.start_background_task(broadcast_status_updates)
+
 
 # --- API 路由定义 ---
 
@@ -84,8 +102,7 @@ def index():
 @app.route('/api/status', methods=['GET'])
 def get_status():
     """获取快递柜的当前完整状态。"""
-    current_state = controller.get_current_state()
-    return jsonify(current_state)
+    return Response(controller.get_state_json(), mimetype='application/json')
 
 @app.route('/api/temperature', methods=['POST'])
 def set_temperature():
@@ -93,16 +110,19 @@ def set_temperature():
     设置目标温度。
     需要一个JSON请求体，例如: {"temperature": 25}
     """
-    data = request.get_json()
-    if not data or 'temperature' not in data:
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or 'temperature' not in data:
         return jsonify({"error": "请求体中缺少 'temperature' 字段"}), 400
 
     try:
         temp = float(data['temperature'])
-        controller.set_temperature(temp)
-        return jsonify({"status": "success", "message": f"设置温度命令已发送: {temp}°C"})
     except (ValueError, TypeError):
         return jsonify({"error": "无效的温度值，必须是整数"}), 400
+    if not (0 <= temp <= 63):
+        return jsonify({"error": "温度必须在0-63度之间"}), 400
+
+    controller.set_temperature(temp)
+    return jsonify({"status": "success", "message": f"设置温度命令已发送: {temp}°C"})
 
 @app.route('/api/locks/open', methods=['POST'])
 def open_locks():
@@ -110,16 +130,20 @@ def open_locks():
     打开一个或多个锁。
     需要一个JSON请求体，例如: {"indices": [1, 6]}
     """
-    data = request.get_json()
-    if not data or 'indices' not in data or not isinstance(data['indices'], list):
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or 'indices' not in data or not isinstance(data['indices'], list):
         return jsonify({"error": "请求体中缺少 'indices' 字段或其不是一个列表"}), 400
     
     try:
         indices = [int(i) for i in data['indices']]
-        controller.open_locks(indices)
-        return jsonify({"status": "success", "message": f"开锁命令已发送，目标索引: {indices}"})
     except (ValueError, TypeError):
         return jsonify({"error": "无效的索引值，必须是整数列表"}), 400
+    invalid = [i for i in indices if not (1 <= i <= 12)]
+    if invalid:
+        return jsonify({"error": f"抽屉索引必须在1-12之间: {invalid}"}), 400
+
+    controller.open_locks(indices)
+    return jsonify({"status": "success", "message": f"开锁命令已发送，目标索引: {indices}"})
 
 @app.route('/api/compressor/manual', methods=['POST'])
 def control_compressor_manual():
@@ -127,8 +151,8 @@ def control_compressor_manual():
     手动控制压缩机启停。
     需要一个JSON请求体，例如: {"start": true} 或 {"start": false}
     """
-    data = request.get_json()
-    if not data or 'start' not in data or not isinstance(data['start'], bool):
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or 'start' not in data or not isinstance(data['start'], bool):
         return jsonify({"error": "请求体中缺少 'start' 字段或其不是一个布尔值"}), 400
     
     start = data['start']
@@ -142,8 +166,8 @@ def control_compressor_auto():
     启用或禁用自动温控。
     需要一个JSON请求体，例如: {"enable": true} 或 {"enable": false}
     """
-    data = request.get_json()
-    if not data or 'enable' not in data or not isinstance(data['enable'], bool):
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or 'enable' not in data or not isinstance(data['enable'], bool):
         return jsonify({"error": "请求体中缺少 'enable' 字段或其不是一个布尔值"}), 400
     
     enable = data['enable']
@@ -158,8 +182,8 @@ def set_system_parameters():
     这是一个广播命令，将重置设备。
     需要一个包含所有参数的JSON请求体。
     """
-    data = request.get_json()
-    if not data:
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not data:
         return jsonify({"error": "请求体不能为空"}), 400
 
     # 定义必要的参数列表，用于校验
@@ -190,22 +214,23 @@ def set_temp_deviation():
     设置温度控制的偏差值。
     需要一个JSON请求体，例如: {"deviation": 2}
     """
-    data = request.get_json()
-    if not data or 'deviation' not in data:
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or 'deviation' not in data:
         return jsonify({"error": "请求体中缺少 'deviation' 字段"}), 400
 
     try:
         deviation = int(data['deviation'])
-        
-        # 调用控制器的新方法
+    except (ValueError, TypeError):
+        return jsonify({"error": "无效的偏差值，必须是整数"}), 400
+    if not (0 <= deviation <= 255):
+        return jsonify({"error": "偏差值必须在0-255之间"}), 400
+
+    try:
         controller.set_temperature_deviation(deviation)
-        
         return jsonify({
             "status": "success",
             "message": f"设置温度控制偏差命令已发送，偏差值: {deviation}°C"
         })
-    except (ValueError, TypeError):
-        return jsonify({"error": "无效的偏差值，必须是整数"}), 400
     except Exception as e:
         app.logger.error(f"设置温度偏差时出错: {e}")
         return jsonify({"status": "error", "message": "处理请求时服务器内部发生错误。"}), 500
@@ -271,4 +296,11 @@ def test_ws_page():
 # --- 启动Web服务器 ---
 if __name__ == '__main__':
     print(f" * 将在 http://{FLASK_HOST}:{FLASK_PORT} 上启动Flask-SocketIO服务器")
-    socketio.run(app, host=FLASK_HOST, port=FLASK_PORT)
\ No newline at end of file
+    # 使用gevent的WSGI服务器和gevent-websocket处理器，每个连接由连接池中的一个greenlet处理
+    server = WSGIServer(
+        (FLASK_HOST, FLASK_PORT),
+        app,
+        handler_class=WebSocketHandler,
+        spawn=Pool(WSGI_POOL_SIZE)
+    )
+    server.serve_forever()
\ No newline at end of file
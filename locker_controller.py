@@ -1,17 +1,119 @@
+import os
 import serial
 import time
+import json
+import queue
+import logging
+import struct
+import itertools
 import threading
-import binascii
-from binascii import unhexlify
-from crcmod import mkCrcFun
+
+logger = logging.getLogger(__name__)
+
+
+def _build_xmodem_tables():
+    """
+    生成CRC-16/XMODEM (多项式0x1021) 的两张256项查找表。
+    T0 为逐字节表；T1[i] 相当于用 T0 连续处理字节 i 和一个0字节，用于一次处理两个字节。
+    """
+    t0 = []
+    for byte in range(256):
+        crc = byte << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x1021) if crc & 0x8000 else (crc << 1)
+        t0.append(crc & 0xFFFF)
+    t1 = [((t << 8) & 0xFFFF) ^ t0[t >> 8] for t in t0]
+    return tuple(t0), tuple(t1)
+
+
+def _crc16_xmodem_table(data):
+    """纯Python查表法 (slicing-by-2) 计算CRC-16/XMODEM，每次迭代处理两个字节。"""
+    crc = 0
+    t0, t1 = _XMODEM_T0, _XMODEM_T1
+    n = len(data) & ~1
+    for b0, b1 in zip(data[0:n:2], data[1:n:2]):
+        crc = t1[(crc >> 8) ^ b0] ^ t0[(crc & 0xFF) ^ b1]
+    if len(data) & 1:
+        crc = ((crc << 8) & 0xFFFF) ^ t0[(crc >> 8) ^ data[-1]]
+    return crc
+
+
+try:
+    from fastcrc import crc16
+    _crc16_xmodem = crc16.xmodem
+except ImportError:
+    try:
+        # 没有 fastcrc 预编译包的平台退回 crcmod (安装了C扩展时同样是原生实现)
+        from crcmod.predefined import mkPredefinedCrcFun
+        _crc16_xmodem = mkPredefinedCrcFun("xmodem")
+    except ImportError:
+        # 两者都没有时使用纯Python查表实现
+        _XMODEM_T0, _XMODEM_T1 = _build_xmodem_tables()
+        _crc16_xmodem = _crc16_xmodem_table
+
+try:
+    # 仅用于判断是否运行在 gevent 猴子补丁之下 (见 _make_serial_reader)
+    from gevent import monkey as _gevent_monkey
+except ImportError:
+    _gevent_monkey = None
+
+# 终端控制板参数表 (18字节): 设备编码5B, 设备地址1B, 备用1B, 上传间隔1B, 压缩机延时1B,
+# 备用2B, 设定温度1B, 温控偏差1B, 备用4B (FF), 备用1B
+_DEVICE_PARAMS_STRUCT = struct.Struct(">5sBxBBxxBB4sx")
+# 帧头之后、数据之前的固定字段: 帧长, 帧号, 设备地址, 功能号
+_FRAME_CORE_STRUCT = struct.Struct(">BBBB")
+_CRC_STRUCT = struct.Struct("<H")  # CRC以小端序传输
+_LOCK_MASK_STRUCT = struct.Struct("<H")  # 开锁控制位 (2B) 以小端序传输
+# 状态上传帧中从偏移18开始的字段: 温控偏差1B, 备用5B, 设备编码5B, 系统状态1B, 备用1B,
+# 压缩机状态1B, 设定温度1B, 采集温度1B, 备用2B, 锁状态2B (小端序)
+_STATUS_STRUCT = struct.Struct("<B5x5sBxBBB2xH")
+_STATUS_OFFSET = 18
+# 温度字节解码表: 1bit符号 + 6bit整数 + 1bit小数(0.5)，256种取值在模块加载时一次性算好
+_TEMP_LUT = tuple(
+    (-1 if b & 0x80 else 1) * (((b >> 1) & 0x3F) + (0.5 if b & 1 else 0.0))
+    for b in range(256)
+)
+
+class StateSnapshot(dict):
+    """
+    不可变的状态快照。
+    快照在多个线程之间无锁共享，因此禁止任何原地修改；需要修改时请先 dict(snapshot) 复制一份。
+    仍是 dict 的子类，可以直接 json.dumps / jsonify / 通过 Socket.IO 发送。
+    """
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("StateSnapshot 是只读的")
+
+    __setitem__ = __delitem__ = __ior__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+    def __reduce__(self):
+        return (StateSnapshot, (dict(self),))
 
 class LockerController:
     """
     智能保鲜快递柜后端控制器。
     该类封装了所有与硬件通信的逻辑，包括命令发送、数据接收和解析。
     """
-    FRAME_HEADER = "FFFF"
-    FRAME_END = "FFF7"
+    FRAME_HEADER = b"\xff\xff"
+    FRAME_END = b"\xff\xf7"
+    BROADCAST_ADDRESS = 0x7F
+    MIN_FRAME_LEN = 10  # 帧头2 + 帧长1 + 帧号1 + 地址1 + 功能号1 + CRC2 + 帧尾2
+    MAX_FRAME_LEN = 64  # 协议中最长的帧为44字节的状态上传帧
+    MIN_COMPRESSOR_CMD_INTERVAL = 10  # 自动温控两次命令之间的最短间隔 (秒)，压缩机启动延时更长时以后者为准
+
+    # 状态帧中的状态码 -> 状态名
+    SYSTEM_STATUS_MAP = {0x00: "STOPPED", 0x01: "PRE_START", 0x02: "RUNNING"}
+    COMPRESSOR_STATUS_MAP = {0x00: "OFF", 0x01: "PRE_START", 0x02: "ON", 0x03: "FAULT"}
+    # 锁状态展开表: 12bit锁状态位 -> 12个布尔值组成的元组 (不可变，所有实例和状态快照共享)
+    LOCK_LUT = tuple(
+        tuple(bool((v >> i) & 1) for i in range(12)) for v in range(4096)
+    )
 
     def __init__(self, port, baudrate=38400, device_address=1, on_update_callback=None):
         """
@@ -24,21 +126,32 @@ class LockerController:
         """
         self.port = port
         self.baudrate = baudrate
-        self.device_address_hex = self._int_to_hex_str(device_address, 1)
+        self.device_address_byte = device_address & 0xFF
         self.on_update_callback = on_update_callback
 
         self.ser = None
         self.is_running = False
         self.listener_thread = None
-        self.frame_num = 0
-
-        # CRC-16/XMODEM 计算函数
-        self.crc16_func = mkCrcFun(0x11021, rev=False, initCrc=0x0000, xorOut=0x0000)
+        self.writer_thread = None
+        self._frame_nums = itertools.cycle(range(1, 256))  # 帧号 1-255 循环，仅由发送线程取用
+        self._send_q = queue.Queue()  # 待发送命令队列，由发送线程统一组帧并写入串口
+        self._rx_buf = bytearray()  # 接收缓冲区，跨多次读取累积数据后再分帧
+
+        # CRC-16/XMODEM 计算函数 (原生实现: 输入bytes, 返回int)
+        self.crc16_func = _crc16_xmodem
+        # 压缩机启停命令的帧模板 (数据固定)，发送时只需写入帧号并重算CRC
+        self._compressor_frames = {
+            start: bytearray(self._build_frame(0x0B, 0x02, b"\x01" if start else b"\x00", 0))
+            for start in (True, False)
+        }
 
         # --- 内部状态变量 ---
         # 这些变量由监听线程更新，并可通过 get_current_state() 获取
-        self.lock = threading.Lock()  # 确保状态更新的线程安全
-        self.state = {
+        # 状态采用写时复制: 每次更新都构建新的不可变快照 (StateSnapshot) 并整体替换 self.state，读取无需加锁
+        self.lock = threading.Lock()  # 串行化多个写者，避免并发更新互相覆盖
+        self._dirty = threading.Event()  # 状态已更新但尚未被 consume_update() 取走
+        self._state_json = None  # get_state_json() 的缓存: (状态快照, JSON字符串)
+        self.state = StateSnapshot({
             "connected": False,
             "last_update_time": 0,
             "device_code": "N/A",
@@ -50,14 +163,17 @@ class LockerController:
             "current_temp": 0.0,
             "compressor_status": "OFF",  # 'OFF', 'PRE_START', 'ON', 'FAULT'
             "system_status": "STOPPED", # 'STOPPED', 'PRE_START', 'RUNNING'
-            "lock_status": [False] * 12  # 12个锁的状态 (0-11)
-        }
+            "lock_status": self.LOCK_LUT[0]  # 12个锁的状态 (0-11)
+        })
         self.auto_compressor_enabled = False # 自动温控开关
+        # 自动温控最近一次发出命令的时间 (time.monotonic)；monotonic 的起点不确定 (常为开机时间)，
+        # 初始为负无穷，保证第一条命令不会被间隔限制吞掉
+        self._last_compressor_cmd_ts = float("-inf")
 
     # --- 1. 连接与生命周期管理 ---
 
     def connect(self):
-        """打开串口并启动后台监听线程。"""
+        """打开串口并启动后台监听线程和发送线程。"""
         if self.is_running:
             print("控制器已在运行。")
             return True
@@ -68,34 +184,72 @@ class LockerController:
                 bytesize=8,
                 parity=serial.PARITY_NONE,
                 stopbits=1,
-                timeout=0.2
+                timeout=1.0  # 空闲时监听线程每秒只唤醒一次；断开时由 cancel_read() 立即唤醒
             )
+            # 每次连接使用新的发送队列和接收缓冲区，上一次连接遗留的命令和半帧数据不会被发送或解析
+            self._send_q = queue.Queue()
+            self._rx_buf = bytearray()
             self.is_running = True
-            self.state["connected"] = True
+            self._update_state({"connected": True})
             self.listener_thread = threading.Thread(target=self._listen_for_data, daemon=True)
             self.listener_thread.start()
+            self.writer_thread = threading.Thread(target=self._writer_loop, args=(self._send_q,), daemon=True)
+            self.writer_thread.start()
             print(f"成功连接到串口 {self.port} 并启动监听。")
             return True
         except serial.SerialException as e:
             print(f"无法打开串口 {self.port}: {e}")
-            self.state["connected"] = False
+            self._update_state({"connected": False})
             return False
 
     def disconnect(self):
-        """停止监听线程并关闭串口。"""
+        """停止监听线程和发送线程并关闭串口。"""
         if self.is_running:
             self.is_running = False
+            if self.ser and self.ser.is_open:
+                self.ser.cancel_read()  # 让阻塞在 read() 中的监听线程立即返回
             if self.listener_thread:
                 self.listener_thread.join(timeout=1)
+            # 发送线程会先写完队列中剩余的帧，再在收到 None 时退出
+            self._send_q.put(None)
+            if self.writer_thread:
+                self.writer_thread.join(timeout=1)
             if self.ser and self.ser.is_open:
                 self.ser.close()
-            self.state["connected"] = False
+            self._update_state({"connected": False})
             print("控制器已断开连接。")
 
     def get_current_state(self):
-        """获取当前快递柜的完整状态（线程安全）。"""
-        with self.lock:
-            return self.state.copy()
+        """
+        获取当前快递柜的完整状态（线程安全，无锁）。
+        返回的是状态快照，之后不会再被修改；调用方也不应修改它。
+        """
+        return self.state
+
+    def get_state_json(self):
+        """
+        获取当前状态的JSON字符串（线程安全）。
+        状态未变化时直接复用上一次的序列化结果，多个客户端轮询时只需序列化一次。
+        """
+        state = self.state
+        cached = self._state_json
+        if cached is None or cached[0] is not state:
+            cached = (state, json.dumps(state))
+            self._state_json = cached
+        return cached[1]
+
+    def consume_update(self, timeout=0):
+        """
+        检查自上次调用以来状态是否有更新，并清除更新标志。
+        供上层合并推送状态，而不是每收到一帧就推送一次。
+
+        :param timeout: 没有更新时最长等待的秒数；0 表示立即返回，None 表示一直等到有更新为止。
+        :return: 有更新时返回 True。
+        """
+        if self._dirty.wait(timeout):
+            self._dirty.clear()
+            return True
+        return False
 
     # --- 2. 公共控制API (供Flask等上层应用调用) ---
 
@@ -109,12 +263,14 @@ class LockerController:
             print("错误：温度必须在0-63度之间。")
             return
         
-        # 编码温度值: 7bit符号(0)+6bit整数+1bit小数(0)
-        temp_bin_str = ('0' if temp_celsius >= 0 else '1') + f'{int(abs(temp_celsius)):06b}' + ('0' if temp_celsius % 1 == 0 else '1')
-        temp_hex_str = self._int_to_hex_str(int(temp_bin_str, 2), 1)
+        # 编码温度值: 1bit符号 + 6bit整数 + 1bit小数
+        temp_byte = (
+            (0x80 if temp_celsius < 0 else 0)
+            | ((int(abs(temp_celsius)) & 0x3F) << 1)
+            | (1 if temp_celsius % 1 else 0)
+        )
 
-        frame = self._build_frame("0B", "04", temp_hex_str)
-        self._send_frame(frame)
+        self._send_command(0x0B, 0x04, bytes([temp_byte]))
 
     def open_locks(self, lock_indices: list):
         """
@@ -122,26 +278,14 @@ class LockerController:
         :param lock_indices: 一个包含要打开的锁的索引的列表, e.g., [1, 6] for 1, 6号抽屉
         """
         print(f"发送开锁命令, 目标抽屉索引: {lock_indices}")
-        # 根据协议，控制位为2B (16bit)，0-11位有效
+        # 根据协议，控制位为2B (16bit)，0-11位有效，对应1-12号抽屉
         control_mask = 0
         for index in lock_indices:
-            index = index - 1  
-            if 0 <= index <= 9:
-                control_mask |= (1 << index)
-        
-        # 生成大端序的16进制字符串，例如 0021
-        big_endian_hex = self._int_to_hex_str(control_mask, 2)
-        
-        # 将其字节反转以匹配小端序的设备，例如 0021 -> 2100
-        little_endian_hex = big_endian_hex[2:4] + big_endian_hex[0:2]
-        
-        # 使用反转后的字节序来构建帧
-        frame = self._build_frame("0c", "03", little_endian_hex)
-        self._send_frame(frame)
-        
-        # box_hex = self._int_to_hex_str(control_mask, 2)
-        # frame = self._build_frame("0c", "03", box_hex)
-        # self._send_frame(frame)
+            if 1 <= index <= 12:
+                control_mask |= 1 << (index - 1)
+
+        # 设备使用小端序，例如 0x0021 -> 21 00
+        self._send_command(0x0C, 0x03, _LOCK_MASK_STRUCT.pack(control_mask))
 
     def control_compressor_manual(self, start: bool):
         """
@@ -149,17 +293,18 @@ class LockerController:
         :param start: True为启动, False为停止。
         """
         self.auto_compressor_enabled = False
-        action = "01" if start else "00"
         action_text = "启动" if start else "停止"
         print(f"发送手动 {action_text} 压缩机命令。自动温控已关闭。")
-        frame = self._build_frame("0b", "02", action)
-        self._send_frame(frame)
+        self._send_frame_template(self._compressor_frames[start])
 
     def enable_auto_compressor_control(self, enable: bool):
         """
         启用或禁用基于温度的自动压缩机控制。
         """
         self.auto_compressor_enabled = enable
+        if enable:
+            # 重新启用时按当前温度立即判断，不受上一轮自动温控的命令间隔限制
+            self._last_compressor_cmd_ts = float("-inf")
         status = "启用" if enable else "禁用"
         print(f"自动温控已 {status}.")
 
@@ -168,22 +313,16 @@ class LockerController:
         设置设备参数。
         """
         print("发送设置设备参数命令...")
-        code_hex = code
-        addr_hex = self._int_to_hex_str(addr, 1)
-        interval_hex = self._int_to_hex_str(interval, 1)
-        delay_hex = self._int_to_hex_str(delay, 1)
-        
-        temp_bin_str = '0' + f'{int(temp):06b}' + '0'
-        temp_hex = self._int_to_hex_str(int(temp_bin_str, 2), 1)
-        
-        deviation_hex = self._int_to_hex_str(deviation, 1)
+        # 设定温度只取整数部分: 0 + 6bit整数 + 0
+        temp_byte = (int(temp) & 0x3F) << 1
 
-        data_payload = (
-            f"{code_hex}{addr_hex}00{interval_hex}{delay_hex}0000"
-            f"{temp_hex}{deviation_hex}ffffffff00"
+        data_payload = _DEVICE_PARAMS_STRUCT.pack(
+            bytes.fromhex(code), addr, interval, delay,
+            temp_byte, deviation, b"\xff\xff\xff\xff"
         )
-        frame = self._build_frame("1c", "05", data_payload)
-        self._send_frame(frame)
+        if self._send_command(0x1C, 0x05, data_payload):
+            # 状态帧中不包含这两个参数，以最近一次下发的值为准
+            self._update_state({"post_interval": interval, "compressor_delay": delay})
         
         
     def set_system_parameters(self, params: dict):
@@ -205,50 +344,30 @@ class LockerController:
 
         try:
             # --- 1. 编码数据部分 (18字节) ---
-            # 根据《终端控制板参数表》的格式进行编码
-            
-            # 设备编码 (5B) - 必须是10个十六进制字符
-            device_code_hex = params['device_code'].ljust(10, 'F')[0:10]
+            # 根据《终端控制板参数表》的格式进行编码，备用字节由 _DEVICE_PARAMS_STRUCT 填充
 
-            # 设备地址 (1B)
-            address_hex = self._int_to_hex_str(params['device_address'], 1)
-
-            # 备用 (1B)
-            reserved1_hex = "00"
-
-            # 状态上传时间间隔 T2 (1B)
-            interval_hex = self._int_to_hex_str(params['upload_interval'], 1)
-
-            # 压缩机启动延时 T3 (1B)
-            delay_hex = self._int_to_hex_str(params['compressor_delay'], 1)
-
-            # 备用 (2B)
-            reserved2_hex = "0000"
-
-            # 设定温度 (1B)
-            temp_celsius = params['set_temp']
-            temp_hex = self._encode_temperature_byte(temp_celsius)
-
-            # 温度控制偏差 (1B)
-            deviation_hex = self._int_to_hex_str(params['temp_deviation'], 1)
-
-            # 备用 (2B + 2B + 1B = 5B) - 用FFFF...FF填充
-            reserved3_hex = "FFFF"
-            reserved4_hex = "FFFF"
-            reserved5_hex = "00"
-
-            # 拼接成完整的18字节数据载荷
-            data_payload = (
-                f"{device_code_hex}{address_hex}{reserved1_hex}{interval_hex}"
-                f"{delay_hex}{reserved2_hex}{temp_hex}{deviation_hex}"
-                f"{reserved3_hex}{reserved4_hex}{reserved5_hex}"
+            # 设备编码 (5B) - 必须是10个十六进制字符
+            device_code = bytes.fromhex(params['device_code'].ljust(10, 'F')[0:10])
+
+            data_payload = _DEVICE_PARAMS_STRUCT.pack(
+                device_code,
+                params['device_address'],  # 设备地址 (1B)
+                params['upload_interval'],  # 状态上传时间间隔 T2 (1B)
+                params['compressor_delay'],  # 压缩机启动延时 T3 (1B)
+                self._encode_temperature_byte(params['set_temp']),  # 设定温度 (1B)
+                params['temp_deviation'],  # 温度控制偏差 (1B)
+                b"\xff\xff\xff\xff"
             )
-            
+
             # --- 2. 构建并发送帧 ---
             # 注意：帧长是28 (0x1C), 功能号是 0x05
             # 设备地址使用广播地址 0x7F
-            frame = self._build_frame_broadcast("1C", "05", data_payload)
-            self._send_frame(frame)
+            if self._send_command(0x1C, 0x05, data_payload, address=self.BROADCAST_ADDRESS):
+                # 状态帧中不包含这两个参数，以最近一次下发的值为准
+                self._update_state({
+                    "post_interval": params['upload_interval'],
+                    "compressor_delay": params['compressor_delay'],
+                })
 
         except KeyError as e:
             print(f"错误: 缺少必要的参数 '{e.args[0]}'")
@@ -269,201 +388,290 @@ class LockerController:
             print(f"错误: 偏差值 {deviation} 无效，必须在 0 到 255 之间。")
             return
 
-        # 2. 准备数据部分 (1字节)
-        # 直接将整数转换为1字节的16进制字符串
-        data_hex = self._int_to_hex_str(deviation, 1)
-
-        # 3. 构建并发送帧
-        # 帧长是11 (0x0B), 功能号是 0x06
-        frame = self._build_frame("0B", "06", data_hex)
-        self._send_frame(frame)
+        # 2. 构建并发送帧
+        # 帧长是11 (0x0B), 功能号是 0x06, 数据部分为1字节偏差值
+        self._send_command(0x0B, 0x06, bytes([deviation]))
 
     # --- 3. 内部工作方法 ---
     
-    def _encode_temperature_byte(self, temp_celsius: float) -> str:
-        """辅助函数：将温度值编码为1字节的16进制字符串。"""
+    def _encode_temperature_byte(self, temp_celsius: float) -> int:
+        """辅助函数：将温度值编码为1字节整数。"""
         if not (-64 < temp_celsius < 64):
              print(f"警告: 温度 {temp_celsius} 超出可编码范围。")
         
-        sign_bit = '1' if temp_celsius < 0 else '0'
+        # 1bit符号 + 6bit整数 + 1bit小数(0.5)，直接按位拼装
         abs_temp = abs(temp_celsius)
-        integer_part_bin = f'{int(abs_temp):06b}'
         epsilon = 1e-9
-        fraction_bit = '1' if (abs_temp % 1) >= (0.5 - epsilon) else '0'
-        
-        temp_bin_str = sign_bit + integer_part_bin + fraction_bit
-        return self._int_to_hex_str(int(temp_bin_str, 2), 1)
-
-    def _build_frame_broadcast(self, length_hex, function_hex, data_hex):
-        """辅助函数：构建一个使用广播地址0x7F的帧。"""
-        self.frame_num = (self.frame_num % 255) + 1
-        frame_num_hex = self._int_to_hex_str(self.frame_num, 1)
+        return (
+            (0x80 if temp_celsius < 0 else 0)
+            | ((int(abs_temp) & 0x3F) << 1)
+            | (1 if (abs_temp % 1) >= (0.5 - epsilon) else 0)
+        )
 
-        # 使用广播地址 0x7F
-        broadcast_address_hex = "7F"
-        
-        core_part = f"{length_hex}{frame_num_hex}{broadcast_address_hex}{function_hex}{data_hex}"
-        crc = self._calculate_crc(core_part)
-        return f"{self.FRAME_HEADER}{core_part}{crc}{self.FRAME_END}"
+    def _make_serial_reader(self):
+        """
+        返回监听线程使用的串口读取函数 read(size)。
+        在 gevent 猴子补丁之下监听线程是协程: POSIX 上 pyserial 在被补丁的 select 上等待，会让出事件循环；
+        Windows 上 pyserial 阻塞在 GetOverlappedResult 中，会卡住整个事件循环 (所有HTTP和WebSocket处理)，
+        因此改为在 gevent 线程池的操作系统线程中执行读取，协程只等待结果。
+        """
+        read = self.ser.read
+        if os.name == "nt" and _gevent_monkey is not None and _gevent_monkey.is_module_patched("threading"):
+            from gevent import get_hub
+            threadpool = get_hub().threadpool
+            return lambda size: threadpool.apply(read, (size,))
+        return read
 
     def _listen_for_data(self):
         """在后台线程中运行，持续接收和处理来自串口的数据。"""
+        read = self._make_serial_reader()
         while self.is_running:
             try:
-                if self.ser.in_waiting > 0:
-                    time.sleep(0.1)  # 等待数据接收完整
-                    n = self.ser.in_waiting
-                    payload = self.ser.read(n)
-                    data_hex = binascii.b2a_hex(payload).decode()
-                    
-                    # CRC校验
-                    if self._verify_crc(data_hex):
-                        self._parse_frame(data_hex)
-                    else:
-                        print(f"接收到无效CRC帧: {data_hex}")
+                # 阻塞等待首字节 (最长等待串口超时时间)，无数据时进入下一轮循环
+                first = read(1)
+                if not first:
+                    continue
+                self._rx_buf += first
+                # 一次性取出驱动缓冲区中已到达的其余字节
+                # 注意: 不使用 ser.read_until(FRAME_END)，pyserial 的实现是逐字节调用 read(1)，
+                # 一个44字节的状态帧需要44次系统调用，而这里每批数据只需两次；
+                # 也不使用 ser.readinto()，pyserial 的实现是先 read() 再复制到目标缓冲区，反而多一次复制
+                waiting = self.ser.in_waiting
+                if waiting:
+                    self._rx_buf += read(waiting)
+
+                # 在内存中分帧、校验并解析，一次读取可能包含多帧或半帧
+                self._process_rx_buffer()
 
             except Exception as e:
                 print(f"监听线程出错: {e}")
                 self.is_running = False # 发生严重错误时退出
         print("监听线程已停止。")
 
-    def _parse_frame(self, data_hex):
+    def _process_rx_buffer(self):
+        """
+        从接收缓冲区中切分出所有完整的帧 (帧头FFFF + 帧长 + ... + 帧尾FFF7)，校验CRC后直接解析。
+        分帧只依赖帧头、帧长和帧尾，不依赖数据到达的时间间隔；
+        帧长、帧尾或CRC不符时都只跳过一个字节后重新寻找帧头。
+        帧经由memoryview在缓冲区上原地校验和解析，不复制帧数据；
+        处理完毕后一次性删除已消费的字节。
+        """
+        buf = self._rx_buf
+        pos = 0
+        with memoryview(buf) as view:
+            while True:
+                head = buf.find(self.FRAME_HEADER, pos)
+                if head < 0:
+                    # 保留最后一个字节，它可能是下一个帧头的前半部分
+                    pos = max(pos, len(buf) - 1)
+                    break
+                pos = head
+                if len(buf) - pos < 3:
+                    break  # 帧长字节尚未到达
+
+                frame_len = buf[pos + 2]
+                if not (self.MIN_FRAME_LEN <= frame_len <= self.MAX_FRAME_LEN):
+                    pos += 1  # 帧长非法，跳过该帧头重新同步
+                    continue
+                end = pos + frame_len
+                if end > len(buf):
+                    break  # 半帧，等待后续数据
+
+                if buf[end - 2] != 0xFF or buf[end - 1] != 0xF7:
+                    pos += 1  # 帧尾不匹配，跳过该帧头重新同步
+                    continue
+
+                with view[pos:end] as frame:
+                    # CRC校验
+                    if not self._verify_crc(frame):
+                        # 可能是数据中碰巧出现的FFFF，只跳过该帧头重新同步，避免吞掉其后的真实帧
+                        logger.warning("接收到无效CRC帧: %s", frame.hex())
+                        pos += 1
+                        continue
+                    self._parse_frame(frame)
+                pos = end
+        del buf[:pos]
+
+    def _parse_frame(self, frame):
+        """
+        解析合法的帧并更新内部状态。
+        frame 可以是 bytes 或指向接收缓冲区的 memoryview，字段按字节偏移直接取整数；
+        返回后 memoryview 会被释放，因此状态中不能保留对 frame 本身的引用。
+        """
         state_updated = False # 标志位
-        
-        """解析合法的帧并更新内部状态。"""
-        if len(data_hex) == 88: # 上传状态帧 (44字节)
-            print(f"接收到状态帧: {data_hex}")
-            with self.lock:
-                # --- 锁状态解析---
-                # 1. 提取小端序的16进制字符串, e.g., '03DE'
-                little_endian_hex = data_hex[72:76]
-
-                # 2. 将其字节反转以得到正确的大端数值, e.g., '03DE' -> 'DE03'
-                if len(little_endian_hex) == 4:
-                    big_endian_hex = little_endian_hex[2:4] + little_endian_hex[0:2]
-
-                    # 3. 将正确的大端16进制字符串转换为整数
-                    lock_int = int(big_endian_hex, 16)
-                else:
-                    # 如果数据长度不符，则认为状态为0，避免出错
-                    lock_int = 0
-
-                self.state["lock_status"] = [(lock_int >> i) & 1 == 1 for i in range(12)]
-
-                # 设备编码
-                self.state["device_code"] = data_hex[48:58]
-
-                # 系统状态
-                system_status_hex = data_hex[58:60]
-                sys_status_map = {"00": "STOPPED", "01": "PRE_START", "02": "RUNNING"}
-                self.state["system_status"] = sys_status_map.get(system_status_hex, "UNKNOWN")
-
-                # 压缩机状态
-                comp_status_hex = data_hex[62:64]
-                status_map = {"00": "OFF", "01": "PRE_START", "02": "ON", "03": "FAULT"}
-                self.state["compressor_status"] = status_map.get(comp_status_hex, "UNKNOWN")
-
-                # 采集温度
-                temp_hex = data_hex[66:68]
-                self.state["current_temp"] = self._decode_temperature(temp_hex)
-
-                # 设定温度
-                set_temp_hex = data_hex[64:66]
-                self.state["set_point_temp"] = self._decode_temperature(set_temp_hex)
-                
-                # 温控偏差
-                self.state["temp_deviation"] = int(data_hex[36:38], 16)
-                
-                self.state["last_update_time"] = time.time()
-                
-                
-                
-                state_updated = True
-                
+
+        if len(frame) == 44: # 上传状态帧 (44字节)
+            # 逐帧日志只在开启DEBUG级别时才格式化十六进制字符串
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("接收到状态帧: %s", frame.hex())
+            # 先在锁外完成全部解码，锁内只做赋值，缩短持锁时间
+
+            # 一次 unpack_from 取出全部定长字段; 锁状态为2字节小端序, e.g., 03 DE -> 0xDE03
+            (deviation, device_code, system_status, comp_status,
+             set_temp, current_temp, lock_int) = _STATUS_STRUCT.unpack_from(frame, _STATUS_OFFSET)
+
+            new_values = {
+                "lock_status": self.LOCK_LUT[lock_int & 0xFFF],
+                "device_code": device_code.hex().upper(),  # 设备编码
+                "system_status": self.SYSTEM_STATUS_MAP.get(system_status, "UNKNOWN"),  # 系统状态
+                "compressor_status": self.COMPRESSOR_STATUS_MAP.get(comp_status, "UNKNOWN"),  # 压缩机状态
+                "current_temp": self._decode_temperature_byte(current_temp),  # 采集温度
+                "set_point_temp": self._decode_temperature_byte(set_temp),  # 设定温度
+                "temp_deviation": deviation,  # 温控偏差
+                "last_update_time": time.time(),
+            }
+
+            self._update_state(new_values)
+            self._dirty.set()
+            state_updated = True
+
             # 自动温控逻辑
             if self.auto_compressor_enabled:
                 self._auto_manage_compressor()
 
-        elif len(data_hex) == 28: # ACK帧 (14字节)
-            print(f"接收到ACK帧: {data_hex}")
+        elif len(frame) == 14: # ACK帧 (14字节)
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("接收到ACK帧: %s", frame.hex())
             # 可以根据需要解析ACK帧内容
             pass
         
             # 如果状态已更新并且设置了回调函数，则调用它
         if state_updated and self.on_update_callback:
             try:
-                # 传递最新的状态副本
+                # 传递最新的状态快照
                 self.on_update_callback(self.get_current_state())
             except Exception as e:
                 print(f"执行更新回调时出错: {e}")
 
-    def _auto_manage_compressor(self):
-        """根据当前温度和设定值自动控制压缩机。"""
+    def _update_state(self, values):
+        """以写时复制的方式更新状态: 构建新的不可变快照后整体替换引用。"""
         with self.lock:
-            current = self.state["current_temp"]
-            set_point = self.state["set_point_temp"]
-            deviation = self.state["temp_deviation"]
+            self.state = StateSnapshot(self.state, **values)
+
+    def _auto_manage_compressor(self):
+        """
+        根据当前温度和设定值自动控制压缩机。
+        温度处于上下限之间时不下发命令 (滞回)；设备上报的压缩机状态已符合期望时也不下发。
+        与期望不符时 (包括命令丢失或被设备忽略) 重新下发，但两次命令之间至少间隔
+        MIN_COMPRESSOR_CMD_INTERVAL 与压缩机启动延时 (compressor_delay) 中的较大者，
+        避免温度在边界附近抖动时频繁启停。
+        """
+        state = self.state
+        current = state["current_temp"]
+        set_point = state["set_point_temp"]
+        deviation = state["temp_deviation"]
             
         upper_bound = set_point + deviation
         lower_bound = set_point - deviation
         
-        # 如果当前温度高于上限，则启动压缩机
+        # 高于上限启动压缩机，低于下限停止压缩机，其余情况维持原命令
         if current > upper_bound:
-            print("[自动温控] 温度过高，启动压缩机。")
-            self._send_frame(self._build_frame("0b", "02", "01"))
-        # 如果当前温度低于下限，则停止压缩机
+            desired = True
         elif current < lower_bound:
+            desired = False
+        else:
+            return
+
+        compressor_status = state["compressor_status"]
+        if compressor_status == "FAULT":
+            return  # 压缩机故障时不自动启停
+        if desired == (compressor_status in ("ON", "PRE_START")):
+            return  # 设备已处于期望状态
+
+        now = time.monotonic()
+        interval = max(self.MIN_COMPRESSOR_CMD_INTERVAL, state["compressor_delay"])
+        if now - self._last_compressor_cmd_ts < interval:
+            return  # 距上一次命令太近，等待后续状态帧再判断
+        self._last_compressor_cmd_ts = now
+
+        if desired:
+            print("[自动温控] 温度过高，启动压缩机。")
+        else:
             print("[自动温控] 温度已达标，停止压缩机。")
-            self._send_frame(self._build_frame("0b", "02", "00"))
-
-    def _decode_temperature(self, temp_hex):
-        """从16进制字符串解码温度值。"""
-        temp_int = int(temp_hex, 16)
-        temp_bin = f'{temp_int:08b}'
-        sign = -1 if temp_bin[0] == '1' else 1
-        integer_part = int(temp_bin[1:7], 2)
-        fraction_part = 0.5 if temp_bin[7] == '1' else 0.0
-        return sign * (integer_part + fraction_part)
-
-    def _build_frame(self, length_hex, function_hex, data_hex):
-        """构建一个完整的待发送帧字符串。"""
-        self.frame_num = (self.frame_num % 255) + 1
-        frame_num_hex = self._int_to_hex_str(self.frame_num, 1)
-
-        core_part = f"{length_hex}{frame_num_hex}{self.device_address_hex}{function_hex}{data_hex}"
-        crc = self._calculate_crc(core_part)
-        return f"{self.FRAME_HEADER}{core_part}{crc}{self.FRAME_END}"
-
-    def _send_frame(self, frame_hex):
-        """将16进制字符串帧转换为bytes并发送。"""
-        if self.ser and self.ser.is_open:
+        self._send_frame_template(self._compressor_frames[desired])
+
+    def _decode_temperature_byte(self, b: int) -> float:
+        """从1字节温度编码解码温度值。"""
+        return _TEMP_LUT[b]
+
+    def _build_frame(self, length, function, data, frame_num, address=None):
+        """
+        构建一个完整的待发送帧。
+
+        :param length: 帧长 (整帧字节数).
+        :param function: 功能号.
+        :param data: 数据部分 (bytes).
+        :param frame_num: 帧号 (1-255).
+        :param address: 目标地址，默认为本控制器的设备地址.
+        """
+        if address is None:
+            address = self.device_address_byte
+
+        core = _FRAME_CORE_STRUCT.pack(length, frame_num, address, function) + data
+        crc = _CRC_STRUCT.pack(self._calculate_crc(core))
+        return b"".join((self.FRAME_HEADER, core, crc, self.FRAME_END))
+
+    def _send_command(self, length, function, data, address=None):
+        """
+        将一条命令放入发送队列，参数同 _build_frame (帧号除外)。
+        API线程和监听线程都会发送命令，统一由发送线程分配帧号、组帧并写串口，
+        因此帧号按实际发送顺序递增，帧也不会在总线上交错。
+        :return: 命令已入队时返回 True。
+        """
+        return self._enqueue((length, function, data, address))
+
+    def _send_frame_template(self, template):
+        """
+        将一个预先组好的帧模板 (bytearray) 放入发送队列。
+        帧号和CRC由发送线程在发送前原地写入，因此模板只能通过此方法发送。
+        """
+        return self._enqueue(template)
+
+    def _enqueue(self, command):
+        """
+        将命令放入发送队列。只在控制器运行期间接受命令:
+        disconnect() 之后入队的命令不会被发送，也不会残留到下一次 connect()。
+        :return: 命令已入队时返回 True。
+        """
+        if self.is_running and self.ser and self.ser.is_open:
+            self._send_q.put(command)
+            return True
+        print("错误: 串口未连接或已关闭。")
+        return False
+
+    def _writer_loop(self, send_q):
+        """在后台线程中运行，按入队顺序组帧并逐个写入串口。"""
+        while True:
+            command = send_q.get()
+            if command is None:
+                break
+            if isinstance(command, bytearray):
+                # 帧模板: 只有发送线程会修改它，写入帧号并重算CRC即可发送
+                frame = command
+                frame[3] = next(self._frame_nums)
+                with memoryview(frame) as view:
+                    _CRC_STRUCT.pack_into(frame, len(frame) - 4, self._calculate_crc(view[2:-4]))
+            else:
+                length, function, data, address = command
+                frame = self._build_frame(length, function, data, next(self._frame_nums), address)
             try:
-                data_bytes = bytes.fromhex(frame_hex)
-                self.ser.write(data_bytes)
-                print(f"-> 已发送: {frame_hex}")
+                self.ser.write(frame)
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("-> 已发送: %s", frame.hex())
             except Exception as e:
                 print(f"发送数据失败: {e}")
-        else:
-            print("错误: 串口未连接或已关闭。")
-
-    def _calculate_crc(self, data_hex):
-        """计算16进制字符串的CRC值。"""
-        crc_out = hex(self.crc16_func(unhexlify(data_hex)))
-        crc_data = crc_out[2:].zfill(4)
-        return crc_data[2:] + crc_data[:2] # 返回小端格式的CRC
-
-    def _verify_crc(self, received_hex):
-        """验证接收到的16进制字符串帧的CRC。"""
-        if len(received_hex) < 10: return False
-        core_part = received_hex[4:-8]
-        received_crc = received_hex[-8:-4]
-        calculated_crc = self._calculate_crc(core_part)
-        return received_crc == calculated_crc
-
-    @staticmethod
-    def _int_to_hex_str(value, byte_count):
-        """将整数转换为指定字节数的16进制字符串，并左补零。"""
-        return f'{value:0{byte_count*2}x}'
+        print("发送线程已停止。")
+
+    def _calculate_crc(self, core):
+        """计算CRC-16/XMODEM值 (int)。"""
+        return self.crc16_func(core)
+
+    def _verify_crc(self, frame):
+        """验证接收到的帧 (bytes 或 memoryview) 的CRC。"""
+        if len(frame) < self.MIN_FRAME_LEN: return False
+        # 直接按偏移读取帧尾前的2字节CRC，不再切片
+        (received_crc,) = _CRC_STRUCT.unpack_from(frame, len(frame) - 4)
+        return self._calculate_crc(frame[2:-4]) == received_crc
 
 # --- 使用示例 (如何将此类用于后端) ---
 if __name__ == "__main__":
@@ -478,6 +686,9 @@ if __name__ == "__main__":
     #     print("未找到可用串口。请确保虚拟串口或物理设备已连接。")
     #     exit()
 
+    # 示例中显示逐帧收发日志
+    logging.basicConfig(level=logging.DEBUG, format="%(message)s")
+
     # 2. 初始化控制器 (请修改为你的串口号)
     SERIAL_PORT = "COM2"  # <<<--- 修改为你的串口号
     controller = LockerController(port=SERIAL_PORT, device_address=1)
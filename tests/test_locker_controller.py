@@ -0,0 +1,265 @@
+import threading
+import unittest
+from unittest import mock
+
+import locker_controller
+from locker_controller import LockerController
+
+
+class FakeSerial:
+    """串口替身: 不启动发送线程时命令停留在发送队列中，启动时记录写出的帧。"""
+    is_open = True
+
+    def __init__(self):
+        self.written = []
+
+    def write(self, data):
+        self.written.append(bytes(data))
+
+
+def crc16_xmodem(data):
+    """逐位计算CRC-16/XMODEM，独立于被测代码的查表/原生实现。"""
+    crc = 0
+    for byte in data:
+        crc ^= byte << 8
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x1021) if crc & 0x8000 else (crc << 1)
+            crc &= 0xFFFF
+    return crc
+
+
+def make_frame(function, data, frame_num=1, address=1):
+    """按协议组帧: FFFF + 帧长 + 帧号 + 地址 + 功能号 + 数据 + CRC(小端) + FFF7。"""
+    core = bytes([len(data) + 10, frame_num, address, function]) + data
+    return b"\xff\xff" + core + crc16_xmodem(core).to_bytes(2, "little") + b"\xff\xf7"
+
+
+def temp_byte(celsius):
+    """按协议编码温度: 1bit符号 + 6bit整数 + 1bit小数(0.5)。"""
+    return (
+        (0x80 if celsius < 0 else 0)
+        | ((int(abs(celsius)) & 0x3F) << 1)
+        | (1 if abs(celsius) % 1 else 0)
+    )
+
+
+def status_frame(current_temp, compressor=0x00, set_temp=4, deviation=2,
+                 device_code=b"\x00" * 5, system=0x02, locks=0):
+    """构建一个44字节的状态上传帧 (数据部分34字节，帧内偏移 = 数据偏移 + 6)。"""
+    data = bytearray(34)
+    data[18 - 6] = deviation
+    data[24 - 6:29 - 6] = device_code
+    data[29 - 6] = system
+    data[31 - 6] = compressor
+    data[32 - 6] = temp_byte(set_temp)
+    data[33 - 6] = temp_byte(current_temp)
+    data[36 - 6:38 - 6] = locks.to_bytes(2, "little")
+    return make_frame(0x01, bytes(data))
+
+
+class FramingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.updates = []
+        self.controller = LockerController("TEST", on_update_callback=self.updates.append)
+
+    def feed(self, *chunks):
+        """模拟监听线程: 每个 chunk 为一次串口读取的数据。"""
+        for chunk in chunks:
+            self.controller._rx_buf += chunk
+            self.controller._process_rx_buffer()
+
+    def test_frame_split_across_reads(self):
+        frame = status_frame(5)
+        self.feed(frame[:10])
+        self.assertEqual(self.updates, [])
+        self.feed(frame[10:40])
+        self.assertEqual(self.updates, [])
+        self.feed(frame[40:])
+        self.assertEqual(len(self.updates), 1)
+        self.assertEqual(self.controller._rx_buf, b"")
+
+    def test_leading_garbage_and_bad_length_are_skipped(self):
+        frame = status_frame(5)
+        # 垃圾字节、帧长过短 (0x03) 和过长 (0xFF) 的伪帧头之后是一个合法帧
+        self.feed(b"\x00\x12\xff\xff\x03junk\xff\xff\xff" + frame)
+        self.assertEqual(len(self.updates), 1)
+        self.assertEqual(self.controller._rx_buf, b"")
+
+    def test_resync_after_bad_crc(self):
+        good = status_frame(5)
+        bad = bytearray(status_frame(7))
+        bad[20] ^= 0x01
+        with self.assertLogs("locker_controller", "WARNING"):
+            self.feed(bytes(bad) + good)
+        self.assertEqual(len(self.updates), 1)
+        self.assertEqual(self.updates[0]["current_temp"], 5.0)
+        self.assertEqual(self.controller._rx_buf, b"")
+
+    def test_two_frames_in_one_read(self):
+        self.feed(status_frame(5) + status_frame(6))
+        self.assertEqual([u["current_temp"] for u in self.updates], [5.0, 6.0])
+
+    def test_partial_header_is_kept(self):
+        self.feed(status_frame(5) + b"\xff")
+        self.assertEqual(len(self.updates), 1)
+        self.assertEqual(self.controller._rx_buf, b"\xff")
+        self.feed(status_frame(6)[1:])
+        self.assertEqual(len(self.updates), 2)
+
+
+class StatusDecodeTest(unittest.TestCase):
+
+    def setUp(self):
+        self.controller = LockerController("TEST")
+        self.frame = status_frame(
+            current_temp=-5.5, compressor=0x02, set_temp=4.5, deviation=3,
+            device_code=b"\xa1\xb2\xc3\xd4\xe5", system=0x01, locks=0b1000_0000_0101,
+        )
+
+    def assert_decoded(self, state):
+        self.assertEqual(state["device_code"], "A1B2C3D4E5")
+        self.assertEqual(state["system_status"], "PRE_START")
+        self.assertEqual(state["compressor_status"], "ON")
+        self.assertEqual(state["current_temp"], -5.5)
+        self.assertEqual(state["set_point_temp"], 4.5)
+        self.assertEqual(state["temp_deviation"], 3)
+        self.assertEqual(
+            state["lock_status"],
+            (True, False, True, False, False, False, False, False, False, False, False, True),
+        )
+
+    def test_decode_from_bytes(self):
+        self.controller._parse_frame(self.frame)
+        self.assert_decoded(self.controller.get_current_state())
+
+    def test_decode_in_place_from_receive_buffer(self):
+        self.controller._rx_buf += self.frame
+        self.controller._process_rx_buffer()
+        self.assert_decoded(self.controller.get_current_state())
+
+    def test_unknown_status_codes(self):
+        self.controller._parse_frame(status_frame(5, compressor=0x09, system=0x07))
+        state = self.controller.get_current_state()
+        self.assertEqual(state["compressor_status"], "UNKNOWN")
+        self.assertEqual(state["system_status"], "UNKNOWN")
+
+
+class OutgoingFrameTest(unittest.TestCase):
+
+    def setUp(self):
+        self.controller = LockerController("TEST", device_address=1)
+        self.controller.ser = FakeSerial()
+        self.controller.is_running = True
+
+    def run_writer(self):
+        """启动发送线程，等它写完队列中的全部命令后退出，返回写出的帧。"""
+        send_q = self.controller._send_q
+        writer = threading.Thread(target=self.controller._writer_loop, args=(send_q,))
+        writer.start()
+        send_q.put(None)
+        writer.join(timeout=5)
+        return self.controller.ser.written
+
+    def test_frame_numbers_and_crc_across_repeated_sends(self):
+        self.controller.control_compressor_manual(True)
+        self.controller.control_compressor_manual(False)
+        self.controller.open_locks([1, 12])
+        self.controller.control_compressor_manual(True)
+        self.controller.open_locks([3])
+        self.controller.control_compressor_manual(False)
+
+        self.assertEqual(self.run_writer(), [
+            make_frame(0x02, b"\x01", frame_num=1),
+            make_frame(0x02, b"\x00", frame_num=2),
+            make_frame(0x03, b"\x01\x08", frame_num=3),
+            make_frame(0x02, b"\x01", frame_num=4),
+            make_frame(0x03, b"\x04\x00", frame_num=5),
+            make_frame(0x02, b"\x00", frame_num=6),
+        ])
+
+    def test_exact_wire_bytes(self):
+        # 参考值由 crcmod 的 xmodem 预定义算法独立算出
+        self.controller.control_compressor_manual(True)
+        self.controller.control_compressor_manual(False)
+        self.controller.open_locks([1, 12])
+        self.assertEqual([frame.hex() for frame in self.run_writer()], [
+            "ffff0b0101020138dbfff7",
+            "ffff0b02010200c550fff7",
+            "ffff0c0301030108ec78fff7",
+        ])
+
+
+class AutoCompressorTest(unittest.TestCase):
+
+    def setUp(self):
+        self.controller = LockerController("TEST")
+        self.controller.ser = FakeSerial()
+        self.controller.is_running = True
+        self.controller.auto_compressor_enabled = True
+        self.now = 1000.0
+        patcher = mock.patch.object(locker_controller.time, "monotonic", lambda: self.now)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def sent_commands(self):
+        """取出发送队列中的压缩机命令: True为启动, False为停止。"""
+        commands = []
+        while not self.controller._send_q.empty():
+            frame = self.controller._send_q.get_nowait()
+            commands.append(frame[6] == 0x01)
+        return commands
+
+    def test_alternating_frames_are_throttled(self):
+        # 设定4°C，偏差2°C: 10°C 高于上限，-5°C 低于下限；设备始终上报压缩机停止
+        for i in range(10):
+            self.controller._parse_frame(status_frame(10 if i % 2 == 0 else -5))
+            self.now += 0.5
+        self.assertEqual(self.sent_commands(), [True])
+
+    def test_no_command_when_device_already_in_desired_state(self):
+        for _ in range(3):
+            self.controller._parse_frame(status_frame(10, compressor=0x02))
+            self.now += 60
+        self.assertEqual(self.sent_commands(), [])
+
+    def test_resends_when_device_disagrees_after_interval(self):
+        self.controller._parse_frame(status_frame(10))
+        self.now += LockerController.MIN_COMPRESSOR_CMD_INTERVAL - 1
+        self.controller._parse_frame(status_frame(10))
+        self.now += 1
+        self.controller._parse_frame(status_frame(10))
+        self.assertEqual(self.sent_commands(), [True, True])
+
+    def test_first_command_sent_when_clock_starts_at_zero(self):
+        # time.monotonic() 的起点不确定，开机后不久启动服务时可能接近0
+        self.now = 0.0
+        self.controller._parse_frame(status_frame(10))
+        self.assertEqual(self.sent_commands(), [True])
+
+    def test_reenabling_auto_control_resets_interval(self):
+        self.controller._parse_frame(status_frame(10))
+        self.controller.enable_auto_compressor_control(False)
+        self.now += 1
+        self.controller.enable_auto_compressor_control(True)
+        self.controller._parse_frame(status_frame(-5, compressor=0x02))
+        self.assertEqual(self.sent_commands(), [True, False])
+
+    def test_interval_follows_configured_compressor_delay(self):
+        self.controller.set_system_parameters({
+            "device_code": "FFFFFFFF", "device_address": 1, "upload_interval": 1,
+            "compressor_delay": 30, "set_temp": 4, "temp_deviation": 2,
+        })
+        self.controller._send_q.get_nowait()  # 丢弃设置参数帧
+        self.assertEqual(self.controller.get_current_state()["compressor_delay"], 30)
+
+        self.controller._parse_frame(status_frame(10))
+        self.now += 29
+        self.controller._parse_frame(status_frame(10))
+        self.now += 1
+        self.controller._parse_frame(status_frame(10))
+        self.assertEqual(self.sent_commands(), [True, True])
+
+
+if __name__ == "__main__":
+    unittest.main()